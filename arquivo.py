@@ -0,0 +1,347 @@
+"""
+Arquivo histórico de AddMoney em segmentos colunares comprimidos.
+
+Cada gravação (lote) cria ARCHIVE_DIR/AAAAMMDD/HH_<lote>.seg por hora UTC de evento; horas
+já fechadas são compactadas num único AAAAMMDD/HH.seg. Cada segmento tem:
+    MAGIC (4 bytes) | versão (u16) | tamanho do cabeçalho (u32) | cabeçalho JSON | colunas (zlib)
+O cabeçalho guarda tempo e citizenid mínimo/máximo, os dicionários de citizenid/reason e
+o offset de cada coluna, para que a leitura pule segmentos sem descomprimir nada.
+
+Uso offline: python arquivo.py 2026-10-01 2026-10-08 [CITIZENID]
+"""
+import array
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+MAGIC = b"SCCA"
+VERSAO = 2
+PREFIXO = struct.Struct("<4sHI")
+TIPOS = ("", "bank", "cash")
+VALOR_MAX = 2 ** 63 - 1  # coluna valor é int64; acima disso satura (o valor exato fica em content)
+
+# nome -> typecode do array (content_offsets tem n + 1 posições; content é bytes)
+COLUNAS = (
+    ("tempo", "d"),
+    ("citizenid", "I"),
+    ("valor", "q"),
+    ("tipo", "B"),
+    ("reason", "I"),
+    ("categoria", "I"),
+    ("content_offsets", "Q"),
+)
+
+
+def diretorio_arquivo():
+    """Pasta base dos segmentos: ARCHIVE_DIR do ambiente (lido na hora, depois do load_dotenv) ou ./archive."""
+    return Path(os.getenv("ARCHIVE_DIR") or Path(__file__).parent / "archive")
+
+
+def _para_bytes(typecode, valores):
+    arr = array.array(typecode, valores)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _de_bytes(typecode, dados):
+    arr = array.array(typecode)
+    arr.frombytes(dados)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def _codificar(valores, dicionario, indice):
+    """Substitui cada valor pelo código no dicionário, acrescentando valores novos."""
+    codigos = []
+    for v in valores:
+        if v not in indice:
+            indice[v] = len(dicionario)
+            dicionario.append(v)
+        codigos.append(indice[v])
+    return codigos
+
+
+def escrever_segmento(registros, destino, lotes=()):
+    """
+    Grava registros (dicts com tempo, citizenid, valor, tipo, reason, categoria, content)
+    como um segmento colunar em destino. lotes (ids dos lotes contidos) vai no cabeçalho.
+    Retorna o cabeçalho gravado.
+    """
+    cabecalho, dados = montar_segmento(registros, lotes)
+    _gravar_atomico(dados, destino)
+    return cabecalho
+
+
+def _gravar_atomico(dados, destino):
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(dados)
+    os.replace(tmp, destino)
+
+
+def montar_segmento(registros, lotes=()):
+    """Codifica registros como segmento em memória. Retorna (cabeçalho, bytes do arquivo)."""
+    registros = sorted(registros, key=lambda r: r["tempo"])
+    citizenids, reasons, categorias = [], [], []
+    offsets = [0]
+    blob = bytearray()
+    for r in registros:
+        blob += (r.get("content") or "").encode("utf-8")
+        offsets.append(len(blob))
+    valores_colunas = {
+        "tempo": [r["tempo"] for r in registros],
+        "citizenid": _codificar((r.get("citizenid") or "" for r in registros), citizenids, {}),
+        "valor": [max(-VALOR_MAX, min(int(r.get("valor") or 0), VALOR_MAX)) for r in registros],
+        "tipo": [TIPOS.index(r.get("tipo")) if r.get("tipo") in TIPOS else 0 for r in registros],
+        "reason": _codificar((r.get("reason") or "" for r in registros), reasons, {}),
+        "categoria": _codificar((r.get("categoria") or "" for r in registros), categorias, {}),
+        "content_offsets": offsets,
+    }
+    blobs = [(nome, zlib.compress(_para_bytes(tc, valores_colunas[nome]))) for nome, tc in COLUNAS]
+    blobs.append(("content", zlib.compress(bytes(blob))))
+    colunas, pos = {}, 0
+    for nome, dados in blobs:
+        colunas[nome] = {"offset": pos, "tamanho": len(dados)}
+        pos += len(dados)
+    cids_validos = [c for c in citizenids if c]
+    cabecalho = {
+        "linhas": len(registros),
+        "tempo_min": registros[0]["tempo"] if registros else None,
+        "tempo_max": registros[-1]["tempo"] if registros else None,
+        "citizenid_min": min(cids_validos) if cids_validos else None,
+        "citizenid_max": max(cids_validos) if cids_validos else None,
+        "citizenids": citizenids,
+        "reasons": reasons,
+        "categorias": categorias,
+        "lotes": list(lotes),
+        "colunas": colunas,
+    }
+    cab_bytes = json.dumps(cabecalho, ensure_ascii=False).encode("utf-8")
+    return cabecalho, PREFIXO.pack(MAGIC, VERSAO, len(cab_bytes)) + cab_bytes + b"".join(dados for _, dados in blobs)
+
+
+def _hora_do_segmento(seg):
+    """Hora UTC (datetime) da partição de um segmento, pelo nome da pasta e do arquivo."""
+    return datetime.datetime.strptime(f"{seg.parent.name}{seg.name[:2]}", "%Y%m%d%H").replace(tzinfo=datetime.timezone.utc)
+
+
+def _lotes_compactados(destino):
+    """Ids de lote já mesclados no HH.seg da hora (vazio se não existe ou é ilegível)."""
+    if not destino.exists():
+        return set()
+    try:
+        with open(destino, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return set(_ler_cabecalho(mm)[0].get("lotes", []))
+    except (OSError, ValueError, KeyError, struct.error):
+        return set()
+
+
+def arquivar(registros, lote, base=None):
+    """
+    Particiona registros pela hora UTC do evento e grava, para cada hora, um segmento
+    AAAAMMDD/HH_<lote>.seg (sem reler nem reescrever o que já existe). Repetir o mesmo lote
+    sobrescreve os mesmos arquivos, e horas cujo HH.seg já contém o lote são puladas, então
+    nada é duplicado. Retorna os caminhos gravados.
+    """
+    base = Path(base) if base else diretorio_arquivo()
+    por_hora = {}
+    for r in registros:
+        hora = datetime.datetime.fromtimestamp(r["tempo"], datetime.timezone.utc)
+        por_hora.setdefault(hora.strftime("%Y%m%d/%H"), []).append(r)
+    # Codifica todas as horas antes de gravar: erro nos dados não deixa o lote gravado pela metade.
+    segmentos = []
+    for particao, regs in sorted(por_hora.items()):
+        dia, hora = particao.split("/")
+        if lote in _lotes_compactados(base / dia / f"{hora}.seg"):
+            continue
+        segmentos.append((base / dia / f"{hora}_{lote}.seg", montar_segmento(regs, [lote])[1]))
+    for destino, dados in segmentos:
+        _gravar_atomico(dados, destino)
+    return [destino for destino, _ in segmentos]
+
+
+def compactar(antes, base=None):
+    """
+    Mescla num único AAAAMMDD/HH.seg os segmentos HH_<lote>.seg de cada hora já fechada
+    (hora terminada até antes, datetime UTC). Segmentos cujo lote já está no HH.seg são só
+    apagados; ilegíveis ficam de lado. Retorna os caminhos reescritos.
+    """
+    base = Path(base) if base else diretorio_arquivo()
+    if not base.exists():
+        return []
+    por_hora = {}
+    for seg in base.glob("*/??_*.seg"):
+        try:
+            hora = _hora_do_segmento(seg)
+        except ValueError:
+            continue
+        if hora + datetime.timedelta(hours=1) <= antes:
+            por_hora.setdefault(seg.parent / f"{seg.name[:2]}.seg", []).append(seg)
+    caminhos = []
+    for destino, segs in sorted(por_hora.items()):
+        cab_linhas = _ler_segmento(destino) if destino.exists() else ({"lotes": []}, [])
+        if cab_linhas is None:
+            os.replace(destino, destino.with_suffix(".invalido"))
+            cab_linhas = ({"lotes": []}, [])
+        lotes = list(cab_linhas[0].get("lotes", []))
+        mesclados, lidos = list(cab_linhas[1]), []
+        for seg in sorted(segs):
+            lido = _ler_segmento(seg)
+            if lido is None:
+                continue
+            lidos.append(seg)
+            novos = [l for l in lido[0].get("lotes", []) if l not in lotes]
+            if novos:
+                mesclados.extend(lido[1])
+                lotes.extend(novos)
+        if len(mesclados) != len(cab_linhas[1]):
+            escrever_segmento(mesclados, destino, lotes)
+            caminhos.append(destino)
+        for seg in lidos:
+            seg.unlink(missing_ok=True)
+    return caminhos
+
+
+def _ler_cabecalho(mm):
+    magic, versao, tam = PREFIXO.unpack_from(mm, 0)
+    if magic != MAGIC or versao != VERSAO:
+        raise ValueError("segmento inválido")
+    inicio_dados = PREFIXO.size + tam
+    return json.loads(bytes(mm[PREFIXO.size:inicio_dados]).decode("utf-8")), inicio_dados
+
+
+def _coluna(mm, cabecalho, inicio_dados, nome):
+    meta = cabecalho["colunas"][nome]
+    pos = inicio_dados + meta["offset"]
+    with memoryview(mm)[pos:pos + meta["tamanho"]] as dados:
+        return zlib.decompress(dados)
+
+
+def _decodificar_linhas(mm, cab, inicio_dados, linhas):
+    """Gera as linhas pedidas do segmento no formato de escrita (dicts de escrever_segmento)."""
+    if not linhas:
+        return []
+    colunas = {nome: _de_bytes(tc, _coluna(mm, cab, inicio_dados, nome)) for nome, tc in COLUNAS}
+    content = _coluna(mm, cab, inicio_dados, "content")
+    offsets = colunas["content_offsets"]
+    return [
+        {
+            "tempo": colunas["tempo"][i],
+            "citizenid": cab["citizenids"][colunas["citizenid"][i]],
+            "valor": colunas["valor"][i],
+            "tipo": TIPOS[colunas["tipo"][i]],
+            "reason": cab["reasons"][colunas["reason"][i]],
+            "categoria": cab["categorias"][colunas["categoria"][i]],
+            "content": content[offsets[i]:offsets[i + 1]].decode("utf-8"),
+        }
+        for i in linhas
+    ]
+
+
+def _ler_segmento(caminho):
+    """Lê cabeçalho e todas as linhas de um segmento (para mesclar). Retorna None se o arquivo for inválido."""
+    try:
+        with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cab, inicio_dados = _ler_cabecalho(mm)
+            return cab, _decodificar_linhas(mm, cab, inicio_dados, range(cab["linhas"]))
+    except (OSError, ValueError, KeyError, IndexError, struct.error, zlib.error):
+        return None
+
+
+def _segmentos_no_intervalo(base, inicio, fim):
+    """
+    Lista segmentos cujas partições (dia/hora) podem conter eventos entre inicio e fim.
+    Um HH_<lote>.seg cujo lote já está no HH.seg (compactação interrompida) não é listado.
+    """
+    hora_ini = inicio.replace(minute=0, second=0, microsecond=0)
+    for dia_dir in sorted(p for p in base.iterdir() if p.is_dir()):
+        compactados = {}
+        for seg in sorted(dia_dir.glob("*.seg")):
+            try:
+                hora = _hora_do_segmento(seg)
+            except ValueError:
+                continue
+            if not (hora_ini <= hora <= fim):
+                continue
+            if seg.name[2:3] == "_":
+                hh = seg.name[:2]
+                if hh not in compactados:
+                    compactados[hh] = _lotes_compactados(dia_dir / f"{hh}.seg")
+                if seg.stem[3:] in compactados[hh]:
+                    continue
+            yield seg
+
+
+def _filtrar_segmento(seg, t_ini, t_fim, citizenid, categorias):
+    """Abre o segmento via mmap e retorna as linhas que passam nos filtros (pula pelo cabeçalho quando possível)."""
+    with open(seg, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        cab, inicio_dados = _ler_cabecalho(mm)
+        if not cab["linhas"] or cab["tempo_max"] < t_ini or cab["tempo_min"] > t_fim:
+            return []
+        cid_code = None
+        if citizenid is not None:
+            if not cab["citizenid_min"] or not (cab["citizenid_min"] <= citizenid <= cab["citizenid_max"]):
+                return []
+            if citizenid not in cab["citizenids"]:
+                return []
+            cid_code = cab["citizenids"].index(citizenid)
+        tempos = _de_bytes("d", _coluna(mm, cab, inicio_dados, "tempo"))
+        cids = _de_bytes("I", _coluna(mm, cab, inicio_dados, "citizenid"))
+        cats = _de_bytes("I", _coluna(mm, cab, inicio_dados, "categoria"))
+        linhas = [
+            i for i in range(cab["linhas"])
+            if t_ini <= tempos[i] <= t_fim
+            and (cid_code is None or cids[i] == cid_code)
+            and (categorias is None or cab["categorias"][cats[i]] in categorias)
+        ]
+        return _decodificar_linhas(mm, cab, inicio_dados, linhas)
+
+
+def ler_arquivo(inicio, fim, citizenid=None, categorias=None, base=None):
+    """
+    Percorre os segmentos entre inicio e fim (datetime, UTC se sem timezone) via mmap e gera
+    dicts {timestamp, citizenid, value, type, reason, categoria, content} em ordem por segmento.
+    Segmentos fora do intervalo ou sem o citizenid são pulados só pelo cabeçalho; segmentos
+    vazios, truncados ou corrompidos são pulados sem interromper a leitura.
+    """
+    base = Path(base) if base else diretorio_arquivo()
+    if not base.exists():
+        return
+    if inicio.tzinfo is None:
+        inicio = inicio.replace(tzinfo=datetime.timezone.utc)
+    if fim.tzinfo is None:
+        fim = fim.replace(tzinfo=datetime.timezone.utc)
+    t_ini, t_fim = inicio.timestamp(), fim.timestamp()
+    for seg in _segmentos_no_intervalo(base, inicio, fim):
+        try:
+            linhas = _filtrar_segmento(seg, t_ini, t_fim, citizenid, categorias)
+        except (OSError, ValueError, KeyError, IndexError, struct.error, zlib.error):
+            continue
+        for r in linhas:
+            yield {
+                "timestamp": datetime.datetime.fromtimestamp(r["tempo"], datetime.timezone.utc).isoformat(),
+                "citizenid": r["citizenid"],
+                "value": r["valor"],
+                "type": r["tipo"],
+                "reason": r["reason"],
+                "categoria": r["categoria"],
+                "content": r["content"],
+            }
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python arquivo.py INICIO FIM [CITIZENID]  (datas ISO, UTC)")
+        sys.exit(1)
+    _inicio = datetime.datetime.fromisoformat(sys.argv[1])
+    _fim = datetime.datetime.fromisoformat(sys.argv[2])
+    for _reg in ler_arquivo(_inicio, _fim, sys.argv[3] if len(sys.argv) > 3 else None):
+        print(json.dumps(_reg, ensure_ascii=False))
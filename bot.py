@@ -4,12 +4,16 @@ import json
 import hashlib
 import logging
 import asyncio
+import atexit
+import bisect
 from pathlib import Path
 from dotenv import load_dotenv
 import datetime
 import re
 import unicodedata
 
+import arquivo
+
 load_dotenv()
 
 # --- LOGGING ---
@@ -37,6 +41,57 @@ ALERT_CHANNELS = _parse_channel_ids("ALERT_CHANNELS", [1387430519582494883, 1421
 SALARY_DUMP_ALERT_CHANNELS = _parse_channel_ids("SALARY_DUMP_ALERT_CHANNELS", [1471831384837460136])
 SALARY_LEGIT_ALERT_CHANNELS = _parse_channel_ids("SALARY_LEGIT_ALERT_CHANNELS", [1473755075670310942])
 
+
+def _parse_intervalo_positivo(env_var: str, default: int) -> int:
+    """Lê um inteiro positivo (intervalo, limite) do ambiente; valores <= 0 ou inválidos voltam ao padrão com aviso."""
+    val = os.getenv(env_var)
+    if not val:
+        return default
+    try:
+        segundos = int(val)
+    except ValueError:
+        segundos = 0
+    if segundos <= 0:
+        logger.warning("%s inválido (%s), usando %s", env_var, val, default)
+        return default
+    return segundos
+
+
+def _parse_shadow_configs(env_var: str) -> list:
+    """
+    Converte SHADOW_CONFIGS em lista de configs shadow.
+    Formato: [nome=]janela_s:threshold:intervalo_min_min:intervalo_max_min separados por ";"
+    Ex: "janela90=90:3:25:35;120:4:20:40". Entradas inválidas são ignoradas com aviso.
+    """
+    configs = []
+    val = os.getenv(env_var) or ""
+    for i, item in enumerate(x.strip() for x in val.split(";")):
+        if not item:
+            continue
+        nome, _, params = item.rpartition("=")
+        nome = nome.strip() or f"shadow_{i + 1}"
+        try:
+            janela, threshold, intervalo_min, intervalo_max = (int(x.strip()) for x in params.split(":"))
+        except ValueError:
+            logger.warning("SHADOW: config inválida ignorada: %s", item)
+            continue
+        if janela <= 0 or threshold <= 0 or not (0 < intervalo_min <= intervalo_max):
+            logger.warning("SHADOW: config inválida ignorada: %s", item)
+            continue
+        configs.append({
+            "nome": nome,
+            "janela": janela,
+            "threshold": threshold,
+            "intervalo_min": intervalo_min * 60,
+            "intervalo_max": intervalo_max * 60,
+            "alerted_spam": {},  # spam_key -> datetime
+            "ignorados_spam": {},  # spam_key -> epochs ordenados que chegaram durante o cooldown
+            "alerted_dump": {},  # citizenid -> {"chain": tuple, "timestamp": datetime}
+            "alerted_legit": {},
+            "contagem": {"spam": 0, "spam_salario": 0, "dump": 0, "legit": 0},
+        })
+    return configs
+
 intents = discord.Intents.default()
 intents.guilds = True
 intents.messages = True
@@ -66,6 +121,29 @@ SALARY_INTERVAL_MAX = 35 * 60
 SALARY_LOG_RETENTION = 2 * 60 * 60
 DISCORD_MESSAGE_LIMIT = 2000
 
+# --- SHADOW (configs alternativas avaliadas sem enviar ao Discord) ---
+SHADOW_CONFIGS = _parse_shadow_configs("SHADOW_CONFIGS")
+SHADOW_REPORT_INTERVAL_SECONDS = _parse_intervalo_positivo("SHADOW_REPORT_INTERVAL_SECONDS", 3600)
+SHADOW_ALERTS_FILE = Path(__file__).parent / "shadow_alerts.jsonl"
+SHADOW_REPORT_FILE = Path(__file__).parent / "shadow_report.json"
+SHADOW_RETENTION = max(
+    [SPAM_LOG_RETENTION, SALARY_LOG_RETENTION]
+    + [c["janela"] for c in SHADOW_CONFIGS]
+)
+shadow_store = {}  # ("spam"|"dump"|"legit", chave) -> lista ordenada de epoch (float), compartilhada entre configs
+shadow_contagem_ativa = {"spam": 0, "spam_salario": 0, "dump": 0, "legit": 0}
+shadow_periodo_inicio = datetime.datetime.now(datetime.timezone.utc)
+shadow_report_task = None
+
+# --- ARQUIVO (registros expirados -> segmentos colunares em arquivo.diretorio_arquivo()) ---
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+ARCHIVE_FLUSH_RECORDS = _parse_intervalo_positivo("ARCHIVE_FLUSH_RECORDS", 500)
+ARCHIVE_FLUSH_INTERVAL_SECONDS = _parse_intervalo_positivo("ARCHIVE_FLUSH_INTERVAL_SECONDS", 300)
+archive_pendentes_contagem = 0  # registros em pendentes.jsonl desde o último flush
+archive_flush_evento = asyncio.Event()  # antecipa o flush quando passa de ARCHIVE_FLUSH_RECORDS
+archive_flush_task = None
+spam_memory_carregado = False
+
 # --- REGEX COMPILADOS ---
 RE_TECHO = re.compile(r"(\*\*.*?added)")
 RE_MOEDA_INTERNA = re.compile(r"(?:kiuds0626|rhis5udie)(_dlc)?", re.IGNORECASE)
@@ -291,15 +369,24 @@ def encontrar_cadeia_30min(entries):
         except (ValueError, KeyError):
             continue
     valid.sort(key=lambda x: x[0])
+    indices = indices_cadeia([ts.timestamp() for ts, _ in valid], SALARY_INTERVAL_MIN, SALARY_INTERVAL_MAX)
+    return [valid[i][1] for i in indices]
+
+
+def indices_cadeia(tempos, intervalo_min, intervalo_max):
+    """
+    Recebe epochs ordenados e retorna os índices da maior cadeia (2+) com intervalos
+    consecutivos entre intervalo_min e intervalo_max segundos. Lista vazia se não houver.
+    """
     best_chain = []
-    for i in range(len(valid)):
-        chain = [valid[i][1]]
-        last_ts = valid[i][0]
-        for j in range(i + 1, len(valid)):
-            delta = (valid[j][0] - last_ts).total_seconds()
-            if SALARY_INTERVAL_MIN <= delta <= SALARY_INTERVAL_MAX:
-                chain.append(valid[j][1])
-                last_ts = valid[j][0]
+    for i in range(len(tempos)):
+        chain = [i]
+        last_ts = tempos[i]
+        for j in range(i + 1, len(tempos)):
+            delta = tempos[j] - last_ts
+            if intervalo_min <= delta <= intervalo_max:
+                chain.append(j)
+                last_ts = tempos[j]
             else:
                 break
         if len(chain) >= 2 and len(chain) > len(best_chain):
@@ -344,6 +431,373 @@ def verificar_salario_legitimo(texto, trecho):
     return True, valor, reason_extraido, tipo
 
 
+def _registro_arquivo(t, content):
+    """Monta o registro do arquivo histórico a partir do timestamp (datetime) e do texto da log."""
+    match_reason = RE_REASON.search(content)
+    valor_match = RE_VALOR.search(content)
+    if verificar_dump_salario(content, None)[0]:
+        categoria = "dump"
+    elif verificar_salario_legitimo(content, None)[0]:
+        categoria = "legit"
+    else:
+        categoria = "comum"
+    return {
+        "tempo": t.timestamp(),
+        "citizenid": extrair_citizenid(content) or "",
+        "valor": int(valor_match.group(1)) if valor_match else 0,
+        "tipo": extrair_tipo_dinheiro(content) or "",
+        "reason": match_reason.group(1).strip() if match_reason else "",
+        "categoria": categoria,
+        "content": content,
+    }
+
+
+def _arquivo_pendentes():
+    return arquivo.diretorio_arquivo() / "pendentes.jsonl"
+
+
+def arquivar_registros(registros):
+    """
+    Grava registros em pendentes.jsonl (antes de o JSON de origem ser salvo sem eles). Passando
+    de ARCHIVE_FLUSH_RECORDS, só sinaliza o loop de flush; nada de segmento é gravado aqui.
+    """
+    global archive_pendentes_contagem
+    if not ARCHIVE_ENABLED or not registros:
+        return
+    try:
+        _arquivo_pendentes().parent.mkdir(parents=True, exist_ok=True)
+        with open(_arquivo_pendentes(), "a", encoding="utf-8") as f:
+            for r in registros:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    except IOError as e:
+        logger.error("Erro ao salvar %s: %s (%d registros perdidos)", _arquivo_pendentes().name, e, len(registros))
+        return
+    archive_pendentes_contagem += len(registros)
+    if archive_pendentes_contagem >= ARCHIVE_FLUSH_RECORDS:
+        archive_flush_evento.set()
+
+
+def separar_expirados(entries, cutoff):
+    """
+    Retorna as entries de spam com timestamp > cutoff e manda as expiradas para o arquivo
+    histórico. Só o store de spam arquiva: ele recebe cada log AddMoney uma única vez
+    (as de salário também estão lá), então nada é gravado em dobro.
+    """
+    mantidos, expirados = [], []
+    for e in entries:
+        t = parse_timestamp(e.get("timestamp", ""))
+        if t and t > cutoff:
+            mantidos.append(e)
+        elif t:
+            expirados.append(_registro_arquivo(t, e.get("content", "")))
+    arquivar_registros(expirados)
+    return mantidos
+
+
+def _rejeitar_registros(registros):
+    """Separa em rejeitados.jsonl registros que não puderam virar segmento."""
+    try:
+        with open(arquivo.diretorio_arquivo() / "rejeitados.jsonl", "a", encoding="utf-8") as f:
+            for r in registros:
+                f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+    except IOError as e:
+        logger.error("Erro ao salvar rejeitados.jsonl: %s", e)
+
+
+def _ler_lote(caminho):
+    registros = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registros.append(json.loads(linha))
+            except json.JSONDecodeError:
+                continue
+    return registros
+
+
+def _processar_lote(caminho):
+    """
+    Grava um lote_<id>.jsonl em segmentos e apaga o arquivo. O id do lote fica no cabeçalho
+    de cada hora gravada, então repetir o lote (falha no meio, crash) não duplica linhas.
+    Erro de disco propaga para nova tentativa; erro nos dados grava registro a registro
+    e move os que falharem para rejeitados.jsonl.
+    """
+    lote = caminho.stem[len("lote_"):]
+    registros = _ler_lote(caminho)
+    try:
+        caminhos = arquivo.arquivar(registros, lote)
+    except OSError:
+        raise
+    except Exception as e:
+        logger.exception("ARQUIVO: erro nos dados do lote %s, gravando registro a registro: %s", lote, e)
+        rejeitados, caminhos = [], []
+        for i, r in enumerate(registros):
+            try:
+                caminhos += arquivo.arquivar([r], f"{lote}-{i}")
+            except OSError:
+                raise
+            except Exception:
+                rejeitados.append(r)
+        logger.error("ARQUIVO: %d registros rejeitados (rejeitados.jsonl)", len(rejeitados))
+        _rejeitar_registros(rejeitados)
+    caminho.unlink(missing_ok=True)
+    logger.info("ARQUIVO: lote %s com %d registros gravado em %d segmento(s)", lote, len(registros), len(caminhos))
+
+
+def _fechar_pendentes():
+    """Renomeia pendentes.jsonl para lote_<id>.jsonl. Roda no loop do bot, onde pendentes.jsonl é escrito."""
+    global archive_pendentes_contagem
+    if _arquivo_pendentes().exists():
+        lote = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        os.replace(_arquivo_pendentes(), arquivo.diretorio_arquivo() / f"lote_{lote}.jsonl")
+    archive_pendentes_contagem = 0
+
+
+def _gravar_lotes():
+    """
+    Grava todos os lotes em aberto (inclusive os que sobraram de reinício ou crash) e compacta
+    as horas já fechadas: terminadas há mais que a retenção de spam mais dois flushes, quando
+    não chegam mais registros expirados para elas.
+    """
+    for caminho in sorted(arquivo.diretorio_arquivo().glob("lote_*.jsonl")):
+        _processar_lote(caminho)
+    antes = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SPAM_LOG_RETENTION + 2 * ARCHIVE_FLUSH_INTERVAL_SECONDS)
+    compactados = arquivo.compactar(antes)
+    if compactados:
+        logger.info("ARQUIVO: %d hora(s) compactada(s)", len(compactados))
+
+
+def descarregar_arquivo():
+    """Flush síncrono (usado no encerramento). Em erro de disco, os lotes ficam para o próximo flush."""
+    if not ARCHIVE_ENABLED:
+        return
+    try:
+        _fechar_pendentes()
+        _gravar_lotes()
+    except OSError as e:
+        logger.error("Erro ao gravar arquivo histórico: %s", e)
+
+
+def _carregar_spam_memory():
+    """
+    Na primeira chamada, carrega todas as chaves de spam_logs.json (não só as que recebem log nova),
+    para que nenhuma seja sobrescrita sem passar pelo arquivo histórico.
+    """
+    global spam_memory_carregado
+    if spam_memory_carregado:
+        return
+    spam_memory_carregado = True
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SPAM_LOG_RETENTION)
+    for key_hash, v in carregar_spam_logs().items():
+        logs = separar_expirados(v.get("logs", []), cutoff)
+        if logs:
+            spam_memory[key_hash] = {"trecho": v.get("trecho", ""), "logs": logs}
+
+
+def varrer_spam_memory():
+    """Expira as logs de todas as chaves de spam, remove chaves vazias e salva spam_logs.json."""
+    _carregar_spam_memory()
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SPAM_LOG_RETENTION)
+    for key_hash in list(spam_memory.keys()):
+        spam_memory[key_hash]["logs"] = separar_expirados(spam_memory[key_hash]["logs"], cutoff)
+        if not spam_memory[key_hash]["logs"]:
+            del spam_memory[key_hash]
+    salvar_spam_logs({k: {"trecho": v["trecho"], "logs": v["logs"]} for k, v in spam_memory.items()})
+
+
+async def _loop_descarregar_arquivo():
+    """Flush periódico (ou antecipado por ARCHIVE_FLUSH_RECORDS); a gravação dos segmentos roda fora do loop do bot."""
+    while True:
+        try:
+            await asyncio.wait_for(archive_flush_evento.wait(), timeout=ARCHIVE_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        archive_flush_evento.clear()
+        try:
+            async with spam_lock:
+                varrer_spam_memory()
+                _fechar_pendentes()
+            await asyncio.to_thread(_gravar_lotes)
+        except OSError as e:
+            logger.error("Erro ao gravar arquivo histórico: %s", e)
+        except Exception as e:
+            logger.exception("Erro ao descarregar arquivo histórico: %s", e)
+
+
+def _shadow_registrar(store_key, ts_epoch):
+    """Insere o evento na lista ordenada compartilhada da chave."""
+    tempos = shadow_store.setdefault(store_key, [])
+    bisect.insort(tempos, ts_epoch)
+    return tempos
+
+
+def _shadow_podar(tempos, corte):
+    """Descarta da lista ordenada os epochs <= corte (feito depois de contar, como no caminho ativo)."""
+    idx = bisect.bisect_right(tempos, corte)
+    if idx:
+        del tempos[:idx]
+
+
+def _shadow_ultimo_incluido(tempos, ignorados):
+    """Maior epoch de tempos que não está em ignorados (ambos ordenados, ignorados contido em tempos)."""
+    j = len(ignorados) - 1
+    for t in reversed(tempos):
+        if j >= 0 and ignorados[j] == t:
+            j -= 1
+            continue
+        return t
+    return None
+
+
+def _shadow_salvar_alerta(config, tipo, chave, ts_da_log, detalhe):
+    """Conta e grava em SHADOW_ALERTS_FILE (JSON por linha) um alerta que a config shadow teria enviado."""
+    config["contagem"][tipo] += 1
+    logger.info("SHADOW [%s]: alerta %s para %s (%s)", config["nome"], tipo, chave, detalhe)
+    registro = {
+        "config": config["nome"],
+        "tipo": tipo,
+        "chave": chave,
+        "timestamp_log": ts_da_log.isoformat(),
+        "detalhe": detalhe,
+    }
+    try:
+        with open(SHADOW_ALERTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    except IOError as e:
+        logger.error("Erro ao salvar %s: %s", SHADOW_ALERTS_FILE.name, e)
+
+
+def _shadow_avaliar_cadeia(config, alerted_key, tipo, citizenid, tempos, ts_da_log, now):
+    """Procura cadeia de salário com os intervalos da config; alerta só se a cadeia mudou."""
+    corte = bisect.bisect_right(tempos, now.timestamp() - SALARY_LOG_RETENTION)
+    validos = tempos[corte:]
+    indices = indices_cadeia(validos, config["intervalo_min"], config["intervalo_max"])
+    if not indices:
+        return
+    alerted = config[alerted_key]
+    limpar_chains_antigos(alerted)
+    chain_key = tuple(validos[i] for i in indices)
+    ultima = alerted.get(citizenid)
+    if ultima and ultima.get("chain") == chain_key:
+        return
+    alerted[citizenid] = {"chain": chain_key, "timestamp": now}
+    _shadow_salvar_alerta(config, tipo, citizenid, ts_da_log, f"cadeia de {len(indices)} logs")
+
+
+def avaliar_shadow(texto, spam_key, citizenid, ts_da_log, é_dump, é_legit, now):
+    """
+    Avalia as SHADOW_CONFIGS para um evento já parseado. Cada chave tem uma única lista
+    ordenada de timestamps compartilhada por todas as configs; cada config só faz bisect
+    sobre ela. Nada é enviado ao Discord.
+    """
+    if not SHADOW_CONFIGS:
+        return
+    ts_epoch = ts_da_log.timestamp()
+    now_epoch = now.timestamp()
+
+    tempos_spam = _shadow_registrar(("spam", spam_key), ts_epoch)
+    match_reason = RE_REASON.search(texto)
+    reason = normalizar_reason(match_reason.group(1).strip()) if match_reason else ""
+    tipo_spam = "spam_salario" if reason in REASONS_SALARIO_LEGITIMOS else "spam"
+    corte = now_epoch - SHADOW_RETENTION
+    for config in SHADOW_CONFIGS:
+        # Mesma regra do caminho ativo: evento que chega durante o cooldown não é armazenado,
+        # então fica fora das contagens desta config (a lista compartilhada continua única).
+        ignorados = config["ignorados_spam"].get(spam_key, [])
+        alerted = config["alerted_spam"]
+        ultimo = alerted.get(spam_key)
+        if ultimo is not None and (now - ultimo).total_seconds() < config["janela"]:
+            bisect.insort(ignorados, ts_epoch)
+            config["ignorados_spam"][spam_key] = ignorados
+            _shadow_podar(ignorados, corte)
+            continue
+        ref = _shadow_ultimo_incluido(tempos_spam, ignorados)
+        if ref is not None:
+            inicio = ref - config["janela"]
+            count = (len(tempos_spam) - bisect.bisect_left(tempos_spam, inicio)) - (len(ignorados) - bisect.bisect_left(ignorados, inicio))
+            if count >= config["threshold"]:
+                alerted[spam_key] = now
+                _shadow_salvar_alerta(config, tipo_spam, spam_key, ts_da_log, f"{count} logs em {config['janela']}s")
+        _shadow_podar(ignorados, corte)
+    _shadow_podar(tempos_spam, corte)
+
+    for ativo, store_tipo, alerted_key in ((é_dump, "dump", "alerted_dump"), (é_legit, "legit", "alerted_legit")):
+        if not (ativo and citizenid):
+            continue
+        tempos = _shadow_registrar((store_tipo, citizenid), ts_epoch)
+        for config in SHADOW_CONFIGS:
+            _shadow_avaliar_cadeia(config, alerted_key, store_tipo, citizenid, tempos, ts_da_log, now)
+        _shadow_podar(tempos, corte)
+
+
+def _shadow_contar_ativo(tipo):
+    """Conta um alerta enviado pela config ativa, para comparação no relatório shadow."""
+    if SHADOW_CONFIGS:
+        shadow_contagem_ativa[tipo] += 1
+
+
+def gerar_relatorio_shadow():
+    """Grava SHADOW_REPORT_FILE comparando config ativa x shadows no período, zera as contagens e rotaciona SHADOW_ALERTS_FILE."""
+    global shadow_periodo_inicio
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for store_key in list(shadow_store.keys()):
+        tempos = shadow_store[store_key]
+        if not tempos or tempos[-1] <= now.timestamp() - SHADOW_RETENTION:
+            del shadow_store[store_key]
+    for config in SHADOW_CONFIGS:
+        for key in list(config["alerted_spam"].keys()):
+            if (now - config["alerted_spam"][key]).total_seconds() >= config["janela"]:
+                del config["alerted_spam"][key]
+        for key in list(config["ignorados_spam"].keys()):
+            ignorados = config["ignorados_spam"][key]
+            if not ignorados or ignorados[-1] <= now.timestamp() - SHADOW_RETENTION:
+                del config["ignorados_spam"][key]
+    relatorio = {
+        "periodo_inicio": shadow_periodo_inicio.isoformat(),
+        "periodo_fim": now.isoformat(),
+        "chaves_em_memoria": len(shadow_store),
+        "ativa": {
+            "janela": TIME_WINDOW_SECONDS,
+            "threshold": LOG_COUNT_THRESHOLD,
+            "intervalo_min": SALARY_INTERVAL_MIN,
+            "intervalo_max": SALARY_INTERVAL_MAX,
+            "contagem": dict(shadow_contagem_ativa),
+        },
+        "shadow": [
+            {**{k: c[k] for k in ("nome", "janela", "threshold", "intervalo_min", "intervalo_max")}, "contagem": dict(c["contagem"])}
+            for c in SHADOW_CONFIGS
+        ],
+    }
+    try:
+        with open(SHADOW_REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    except IOError as e:
+        logger.error("Erro ao salvar %s: %s", SHADOW_REPORT_FILE.name, e)
+    logger.info("SHADOW RELATÓRIO: ativa %s", relatorio["ativa"]["contagem"])
+    for item in relatorio["shadow"]:
+        logger.info("SHADOW RELATÓRIO: %s %s", item["nome"], item["contagem"])
+    for contagem in [shadow_contagem_ativa] + [c["contagem"] for c in SHADOW_CONFIGS]:
+        for tipo in contagem:
+            contagem[tipo] = 0
+    shadow_periodo_inicio = now
+    # Rotaciona os alertas shadow: fica só o período atual e o anterior (.1).
+    try:
+        if SHADOW_ALERTS_FILE.exists():
+            os.replace(SHADOW_ALERTS_FILE, SHADOW_ALERTS_FILE.with_name(SHADOW_ALERTS_FILE.name + ".1"))
+    except OSError as e:
+        logger.error("Erro ao rotacionar %s: %s", SHADOW_ALERTS_FILE.name, e)
+    return relatorio
+
+
+async def _loop_relatorio_shadow():
+    while True:
+        await asyncio.sleep(SHADOW_REPORT_INTERVAL_SECONDS)
+        try:
+            gerar_relatorio_shadow()
+        except Exception as e:
+            logger.exception("Erro ao gerar relatório shadow: %s", e)
+
+
 async def enviar_alerta(canal_id, mensagem, tipo="alerta"):
     """Envia mensagem ao canal com tratamento de erros e limite de caracteres."""
     try:
@@ -463,6 +917,7 @@ async def _enviar_alerta_spam_e_atualizar(spam_key, log_exibir, log_count, hora_
     spam_alerts[hour_key]["_updated"] = now.isoformat()
     salvar_spam_alerts(spam_alerts)
     count = spam_alerts[hour_key][spam_key]["count"]
+    _shadow_contar_ativo("spam_salario" if is_salario else "spam")
     channels = SALARY_LEGIT_ALERT_CHANNELS if is_salario else ALERT_CHANNELS
     send_fn = enviar_alerta_spam_salario_embed if is_salario else enviar_alerta_spam_embed
     for cid in channels:
@@ -497,10 +952,19 @@ async def enviar_alerta_spam_salario_embed(canal_id, log_exibir, count, hora_atu
 
 @client.event
 async def on_ready():
+    global shadow_report_task, archive_flush_task
     logger.info("🤖 Bot Anti Trigger SCC conectado como %s", client.user)
     logger.info("🎯 Canal monitorado: %s", TARGET_CHANNEL_ID)
     logger.info("⏰ Spam: %s logs em %ss", LOG_COUNT_THRESHOLD, TIME_WINDOW_SECONDS)
     logger.info("📁 Spam: %s | Alertas: %s | Dump: %s | Legítimo: %s", SPAM_LOG_FILE.name, SPAM_ALERTS_FILE.name, SALARY_DUMP_ALERT_CHANNELS, SALARY_LEGIT_ALERT_CHANNELS)
+    if ARCHIVE_ENABLED:
+        logger.info("🗄️ Arquivo histórico: %s (flush a cada %ss ou %s registros)", arquivo.diretorio_arquivo(), ARCHIVE_FLUSH_INTERVAL_SECONDS, ARCHIVE_FLUSH_RECORDS)
+        if archive_flush_task is None or archive_flush_task.done():
+            archive_flush_task = asyncio.create_task(_loop_descarregar_arquivo())
+    if SHADOW_CONFIGS:
+        logger.info("👥 Shadow: %s (relatório a cada %ss)", ", ".join(c["nome"] for c in SHADOW_CONFIGS), SHADOW_REPORT_INTERVAL_SECONDS)
+        if shadow_report_task is None or shadow_report_task.done():
+            shadow_report_task = asyncio.create_task(_loop_relatorio_shadow())
     logger.info("✅ Bot online e monitorando...")
 
 
@@ -586,6 +1050,7 @@ async def on_message(message):
                 ultima_chain = ultima.get("chain") if isinstance(ultima, dict) else ultima
                 if not (ultima_chain == chain_key):
                     alerted_salary_chains[citizenid] = {"chain": chain_key, "timestamp": now}
+                    _shadow_contar_ativo("dump")
                     trecho_mod = mascarar_nome_moeda(trecho)
                     for cid in SALARY_DUMP_ALERT_CHANNELS:
                         await enviar_alerta_dump_embed(cid, trecho_mod, citizenid, cadeia_logs)
@@ -618,6 +1083,7 @@ async def on_message(message):
                 ultima_chain = ultima.get("chain") if isinstance(ultima, dict) else ultima
                 if not (ultima_chain == chain_key):
                     alerted_salary_legit_chains[citizenid] = {"chain": chain_key, "timestamp": now}
+                    _shadow_contar_ativo("legit")
                     trecho_mod = mascarar_nome_moeda(trecho)
                     for cid in SALARY_LEGIT_ALERT_CHANNELS:
                         await enviar_alerta_legit_embed(cid, trecho_mod, citizenid, cadeia_logs)
@@ -630,21 +1096,25 @@ async def on_message(message):
         if ts_da_log.tzinfo is None:
             ts_da_log = ts_da_log.replace(tzinfo=datetime.timezone.utc)
 
+        try:
+            avaliar_shadow(texto_completo, spam_key, citizenid, ts_da_log, é_dump, é_legit, now)
+        except Exception as e:
+            logger.exception("Erro na avaliação shadow (ignorado): %s", e)
+
         async with spam_lock:
             for key in list(alerted_logs.keys()):
                 if (now - alerted_logs[key]).total_seconds() >= TIME_WINDOW_SECONDS:
                     del alerted_logs[key]
 
             if spam_key in alerted_logs:
+                # Não entra no store de spam durante o cooldown; vai direto para o arquivo histórico.
+                arquivar_registros([_registro_arquivo(ts_da_log, texto_completo)])
                 continue
 
             key_hash = spam_log_key_hash(spam_key)
-            cutoff_load = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SPAM_LOG_RETENTION)
+            _carregar_spam_memory()
             if key_hash not in spam_memory:
-                disk_data = carregar_spam_logs()
-                existing = disk_data.get(key_hash, {}).get("logs", [])
-                existing = [e for e in existing if (t := parse_timestamp(e.get("timestamp", ""))) and t > cutoff_load]
-                spam_memory[key_hash] = {"trecho": trecho, "logs": list(existing)}
+                spam_memory[key_hash] = {"trecho": trecho, "logs": []}
 
             ts_valido = ts_iso and parse_timestamp(ts_iso)
             ts_armazenar = ts_iso if ts_valido else datetime.datetime.now(datetime.timezone.utc).isoformat()
@@ -660,7 +1130,7 @@ async def on_message(message):
             log_count, logs_dentro_janela = contar_logs_em_janela(spam_memory[key_hash]["logs"])
 
             cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SPAM_LOG_RETENTION)
-            spam_memory[key_hash]["logs"] = [e for e in spam_memory[key_hash]["logs"] if (t := parse_timestamp(e.get("timestamp", ""))) and t > cutoff]
+            spam_memory[key_hash]["logs"] = separar_expirados(spam_memory[key_hash]["logs"], cutoff)
             spam_data_persist = {k: {"trecho": v["trecho"], "logs": v["logs"]} for k, v in spam_memory.items()}
             salvar_spam_logs(spam_data_persist)
 
@@ -691,4 +1161,5 @@ if __name__ == "__main__":
     if not TOKEN:
         logger.error("TOKEN não encontrado! Configure a variável TOKEN no arquivo .env")
         exit(1)
+    atexit.register(descarregar_arquivo)
     client.run(TOKEN)